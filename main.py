@@ -3,43 +3,278 @@ import os
 import json
 import re
 import uuid
+import csv
+import zipfile
+import hashlib
 import asyncio
-from typing import Optional, List, Tuple, Dict, Any, Union
+import time
+from typing import Optional, List, Tuple, Dict, Any, Union, Iterable, Iterator
 
 import aiofiles
 import aiohttp
-from collections import deque
+from collections import deque, OrderedDict
 from astrbot.api.event import filter, AstrMessageEvent
 from astrbot.api.star import Context, Star, register
 from astrbot.api import logger, AstrBotConfig
-from astrbot.api.message_components import Plain
+from astrbot.api.message_components import Plain, File
 
 PLUGIN_DIR = os.path.dirname(os.path.abspath(__file__))
 
-class TrueRandomManager:
+# 临时疯狂症状表 (1d10)
+TEMP_INSANITIES = (
+    "失忆：只记得最后身处的安全地点。",
+    "假性残疾：心理性失明、失聪或肢体缺失。",
+    "暴力倾向：对周围所有人展开攻击。",
+    "偏执：认为所有人都在图谋不轨。",
+    "人际依赖：将某人视为唯一的依靠。",
+    "昏厥：当场昏倒。",
+    "逃避行为：不顾一切地试图逃离。",
+    "歇斯底里：大笑、哭泣或尖叫。",
+    "恐惧：产生一种特定的恐惧症。",
+    "躁狂：产生一种特定的躁狂症。",
+)
+
+ATTRIBUTE_PATTERN = re.compile(r"([\u4e00-\u9fa5a-zA-Z_]+)\s*(\d+)")
+
+
+def _normalize_attributes(attr_dict: Dict[str, int]) -> Dict[str, int]:
+    """补全 hp/san/mp 对应的上限值"""
+    if "hp" in attr_dict and "max_hp" not in attr_dict: attr_dict["max_hp"] = attr_dict["hp"]
+    if "san" in attr_dict and "max_san" not in attr_dict: attr_dict["max_san"] = attr_dict["san"]
+    if "mp" in attr_dict and "max_mp" not in attr_dict: attr_dict["max_mp"] = attr_dict["mp"]
+    return attr_dict
+
+
+def _iter_card_records(lines: Iterable[str]) -> Iterator[Tuple[int, Optional[str], Union[Dict[str, int], str]]]:
     """
-    真随机数管理器 (基于 Random.org)
-    策略: 缓存 0-1 之间的小数，适用于任意面值的骰子。
+    逐行解析批量导入文本，产出 (行号, 人物名, 属性字典或错误信息)。
+    每行独立识别格式:
+      - JSON Lines: {"name": "张三", "attributes": {"力量": 50}} 或 {"name": "张三", "力量": 50}
+      - CSV: 首列为 name/名字/姓名 的表头行之后的逗号分隔行
+      - Dice! 风格: [.st] 张三-力量50体质60... (名字与属性也可用空格分隔)
     """
-    def __init__(self, buffer_size=100):
-        self.buffer = deque()
-        self.buffer_size = buffer_size
-        self.is_fetching = False
+    csv_header: Optional[List[str]] = None
+    for line_no, raw in enumerate(lines, 1):
+        line = raw.strip().lstrip("\ufeff")
+        if not line or line.startswith("#"):
+            continue
+
+        if line.startswith("{"):
+            try:
+                obj = json.loads(line)
+            except json.JSONDecodeError as e:
+                yield line_no, None, f"JSON 解析失败: {e.msg}"
+                continue
+            name = obj.pop("name", None)
+            source = obj.get("attributes", obj)
+            attrs = {}
+            for k, v in source.items() if isinstance(source, dict) else ():
+                if isinstance(v, (int, float)) and not isinstance(v, bool):
+                    attrs[str(k)] = int(v)
+                elif isinstance(v, str) and v.strip().lstrip("-").isdigit():
+                    attrs[str(k)] = int(v)
+            yield line_no, str(name) if name else None, attrs
+            continue
+
+        csv_name = None
+        if "," in line:
+            cells = [c.strip() for c in next(csv.reader([line]))]
+            if cells[0].lower() in ("name", "名字", "姓名"):
+                csv_header = cells
+                continue
+            # 列数与表头一致且含有数值时才按 CSV 行处理，否则交给 Dice! 风格解析
+            if csv_header and len(cells) == len(csv_header):
+                attrs = {}
+                for key, value in zip(csv_header[1:], cells[1:]):
+                    if key and value.lstrip("-").isdigit():
+                        attrs[key] = int(value)
+                if attrs:
+                    yield line_no, cells[0] or None, attrs
+                    continue
+                csv_name = cells[0] or None
+
+        if line.lower().startswith(".st"):
+            line = line[3:].strip()
+        match = re.match(r"^(.+?)\s*[-－]\s*(.*)$", line) or re.match(r"^(\S+)\s+(.*)$", line)
+        # "力量50 敏捷60" 这类行的首段本身就是属性，不能当作人物名
+        if not match or ATTRIBUTE_PATTERN.fullmatch(match.group(1).strip()):
+            if csv_name:
+                # 形如 CSV 行但没有任何数值列
+                yield line_no, csv_name, {}
+            else:
+                yield line_no, None, "缺少人物名 (格式: 名字-力量50敏捷60)"
+            continue
+        name, attr_text = match.groups()
+        yield line_no, name.strip(), {k: int(v) for k, v in ATTRIBUTE_PATTERN.findall(attr_text)}
+
+
+class EntropyProvider:
+    """
+    熵源接口。
+    子类实现 fetch(count)，返回 count 个 [0, 1) 之间的小数；失败时抛出异常即可，
+    熔断与统计由 TrueRandomManager 统一处理。
+    """
+    name = "base"
+    # 本地熵源不参与对冲请求，只在远程熵源全部不可用时兜底
+    is_local = False
+
+    async def fetch(self, count: int) -> List[float]:
+        raise NotImplementedError
+
+
+def _parse_plain_fractions(text: str) -> List[float]:
+    """解析按行分隔的纯文本小数，丢弃无法解析或越界的行"""
+    numbers = []
+    for line in text.strip().split('\n'):
+        try:
+            if line.strip():
+                value = float(line.strip())
+                if 0.0 <= value < 1.0:
+                    numbers.append(value)
+        except ValueError:
+            pass
+    return numbers
+
+
+class RandomOrgProvider(EntropyProvider):
+    """Random.org 大气噪声真随机源"""
+    name = "random_org"
+
+    def __init__(self, timeout: float = 10):
         self.api_url = "https://www.random.org/decimal-fractions/"
+        self.timeout = timeout
+
+    async def fetch(self, count: int) -> List[float]:
         # 保留20位小数以确保精度足够
-        self.params = {
-            "num": str(buffer_size),
+        params = {
+            "num": str(count),
             "dec": "20",
             "col": "1",
             "format": "plain",
             "rnd": "new"
         }
+        async with aiohttp.ClientSession() as session:
+            async with session.get(self.api_url, params=params, timeout=aiohttp.ClientTimeout(total=self.timeout)) as resp:
+                if resp.status != 200:
+                    raise RuntimeError(f"Random.org API failed: {resp.status}")
+                numbers = _parse_plain_fractions(await resp.text())
+        if not numbers:
+            raise RuntimeError("Random.org returned no valid numbers.")
+        return numbers
+
+
+class HttpEntropyProvider(EntropyProvider):
+    """
+    自定义 HTTP 熵源 (Random.org 的替身)。
+    约定: GET {url}?num=N 返回按行分隔的 [0, 1) 小数。
+    """
+    def __init__(self, url: str, name: str = "http", timeout: float = 10):
+        self.url = url
+        self.name = name
+        self.timeout = timeout
+
+    async def fetch(self, count: int) -> List[float]:
+        async with aiohttp.ClientSession() as session:
+            async with session.get(self.url, params={"num": str(count)}, timeout=aiohttp.ClientTimeout(total=self.timeout)) as resp:
+                if resp.status != 200:
+                    raise RuntimeError(f"{self.name} API failed: {resp.status}")
+                numbers = _parse_plain_fractions(await resp.text())
+        if not numbers:
+            raise RuntimeError(f"{self.name} returned no valid numbers.")
+        return numbers
+
+
+class LocalCSPRNGProvider(EntropyProvider):
+    """基于 os.urandom 的本地密码学安全随机源，一次生成整块"""
+    name = "local"
+    is_local = True
+
+    async def fetch(self, count: int) -> List[float]:
+        return self.generate(count)
+
+    @staticmethod
+    def generate(count: int) -> List[float]:
+        # 每个数取 8 字节中的高 53 位，恰好填满 double 的尾数精度
+        raw = os.urandom(8 * count)
+        return [
+            (int.from_bytes(raw[i:i + 8], "big") >> 11) * (1.0 / (1 << 53))
+            for i in range(0, len(raw), 8)
+        ]
+
+
+class ProviderHealth:
+    """
+    单个熵源的熔断器与健康统计。
+    closed: 正常; open: 连续失败达到阈值，冷却期内直接跳过; half_open: 冷却结束，放行一次试探请求。
+    """
+    def __init__(self, failure_threshold: int = 3, cooldown: float = 60):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.opened_at = 0.0
+        self.consecutive_failures = 0
+        self.successes = 0
+        self.failures = 0
+        self.avg_latency: Optional[float] = None  # 指数滑动平均 (秒)
+        self.last_error = ""
+
+    def available(self, now: float) -> bool:
+        if self.state == "open" and now - self.opened_at >= self.cooldown:
+            self.state = "half_open"
+        return self.state != "open"
+
+    def record_success(self, latency: float):
+        self.successes += 1
+        self.consecutive_failures = 0
+        self.state = "closed"
+        if self.avg_latency is None:
+            self.avg_latency = latency
+        else:
+            self.avg_latency = 0.7 * self.avg_latency + 0.3 * latency
+
+    def record_failure(self, error: str, now: float):
+        self.failures += 1
+        self.consecutive_failures += 1
+        self.last_error = error
+        # 半开状态下试探失败立即重新熔断
+        if self.state == "half_open" or self.consecutive_failures >= self.failure_threshold:
+            self.state = "open"
+            self.opened_at = now
+
+    def rank(self) -> Tuple[int, float]:
+        """排序键: 越小越健康"""
+        return (self.consecutive_failures, self.avg_latency if self.avg_latency is not None else 0.0)
+
+
+class TrueRandomManager:
+    """
+    真随机数管理器 (多熵源)
+    策略: 缓存 0-1 之间的小数 (连同来源熵源名)，适用于任意面值的骰子。
+    补充时向最健康的两个远程熵源并行发起对冲请求，取先成功者；
+    远程熵源全部不可用时由本地 CSPRNG 补充，缓存耗尽时同样逐个降级到 CSPRNG。
+    """
+    def __init__(self, providers: List[EntropyProvider], buffer_size=100,
+                 failure_threshold: int = 3, cooldown: float = 60, hedge: bool = True):
+        self.buffer = deque()
+        self.buffer_size = buffer_size
+        self.is_fetching = False
+        self.hedge = hedge
+        self.providers = providers
+        self.health: Dict[str, ProviderHealth] = {
+            p.name: ProviderHealth(failure_threshold, cooldown) for p in providers
+        }
+        self._fallback = random.SystemRandom()
 
     async def get_fraction(self) -> float:
         """
         获取一个 0-1 之间的随机小数。
         优先从缓存取，缓存不足触发异步补充，缓存为空自动降级。
         """
+        fraction, _ = await self.draw()
+        return fraction
+
+    async def draw(self) -> Tuple[float, str]:
+        """同 get_fraction，额外返回该数来自哪个熵源"""
         # 1. 检查缓存水位，低水位触发补充 (例如少于 20% 时)
         if len(self.buffer) < self.buffer_size * 0.2 and not self.is_fetching:
             asyncio.create_task(self._refill_buffer())
@@ -47,44 +282,415 @@ class TrueRandomManager:
         # 2. 尝试从缓存取值
         if self.buffer:
             return self.buffer.popleft()
-        
-        # 3. 缓存为空，降级到伪随机
-        # logger.debug("TrueRandom buffer empty, fallback to pseudo-random.")
-        return random.random()
+
+        # 3. 缓存为空，降级到本地 CSPRNG
+        return self._fallback.random(), "system"
+
+    async def draw_many(self, count: int) -> List[Tuple[float, str]]:
+        """一次取出 count 个数，只检查一次水位；缓存不足的部分降级到本地 CSPRNG"""
+        if len(self.buffer) - count < self.buffer_size * 0.2 and not self.is_fetching:
+            asyncio.create_task(self._refill_buffer())
+
+        take = min(count, len(self.buffer))
+        result = [self.buffer.popleft() for _ in range(take)]
+        result.extend((self._fallback.random(), "system") for _ in range(count - take))
+        return result
+
+    def _pick_candidates(self) -> List[EntropyProvider]:
+        """按健康度挑选本轮补充使用的熵源"""
+        now = time.monotonic()
+        usable = [p for p in self.providers if self.health[p.name].available(now)]
+        remote = [p for p in usable if not p.is_local]
+        # sorted 是稳定排序，健康度相同时保持配置顺序
+        remote.sort(key=lambda p: self.health[p.name].rank())
+        if remote:
+            return remote[:2] if self.hedge else remote[:1]
+        return [p for p in usable if p.is_local][:1]
+
+    async def _fetch_from(self, provider: EntropyProvider, count: int) -> List[float]:
+        """带计时与熔断记录的单次拉取"""
+        health = self.health[provider.name]
+        start = time.monotonic()
+        try:
+            numbers = await provider.fetch(count)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            health.record_failure(str(e) or type(e).__name__, time.monotonic())
+            raise
+        health.record_success(time.monotonic() - start)
+        return numbers
+
+    async def _hedged_fetch(self, candidates: List[EntropyProvider], count: int) -> Tuple[List[float], str]:
+        """并行请求所有候选熵源，返回最先成功的结果及其熵源名，并取消其余请求"""
+        tasks = {asyncio.create_task(self._fetch_from(p, count)): p for p in candidates}
+        pending = set(tasks)
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result(), tasks[task].name
+                    logger.warning(f"Entropy provider {tasks[task].name} failed: {task.exception()}")
+        finally:
+            for task in pending:
+                task.cancel()
+        return [], ""
 
     async def _refill_buffer(self):
         """异步补充缓存，严禁并发请求"""
         if self.is_fetching:
             return
-        
+
         self.is_fetching = True
         try:
-            # logger.debug("Refilling TrueRandom buffer...")
-            async with aiohttp.ClientSession() as session:
-                async with session.get(self.api_url, params=self.params, timeout=10) as resp:
-                    if resp.status == 200:
-                        text = await resp.text()
-                        # 解析返回的纯文本数字
-                        numbers = []
-                        for line in text.strip().split('\n'):
-                            try:
-                                if line.strip():
-                                    numbers.append(float(line.strip()))
-                            except ValueError:
-                                pass
-                        
-                        if numbers:
-                            self.buffer.extend(numbers)
-                            # logger.info(f"TrueRandom buffer refilled. Current size: {len(self.buffer)}")
-                        else:
-                            logger.warning("Random.org returned no valid numbers.")
-                    else:
-                        logger.warning(f"Random.org API failed: {resp.status}")
-        except Exception as e:
-            logger.warning(f"Failed to connect to Random.org: {e}")
+            count = self.buffer_size - len(self.buffer)
+            if count <= 0:
+                return
+            numbers, source = [], ""
+            candidates = self._pick_candidates()
+            if candidates:
+                numbers, source = await self._hedged_fetch(candidates, count)
+            if not numbers and not any(p.is_local for p in candidates):
+                # 远程熵源全部失败，由本地熵源兜底
+                local = next((p for p in self.providers if p.is_local), None)
+                if local:
+                    try:
+                        numbers = await self._fetch_from(local, count)
+                        source = local.name
+                    except Exception as e:
+                        logger.warning(f"Local entropy provider failed: {e}")
+            if numbers:
+                self.buffer.extend((n, source) for n in numbers)
         finally:
             self.is_fetching = False
 
+    def get_metrics(self) -> List[Dict[str, Any]]:
+        """各熵源的健康与延迟统计"""
+        now = time.monotonic()
+        metrics = []
+        for p in self.providers:
+            h = self.health[p.name]
+            h.available(now)
+            metrics.append({
+                "name": p.name,
+                "state": h.state,
+                "successes": h.successes,
+                "failures": h.failures,
+                "avg_latency_ms": round(h.avg_latency * 1000) if h.avg_latency is not None else None,
+                "last_error": h.last_error,
+            })
+        return metrics
+
+class RollAuditLog:
+    """
+    掷骰审计日志 (只追加)
+    每个群一个 JSON Lines 文件；记录先进入内存缓冲，由后台任务按批次刷盘，
+    单个文件超过上限时滚动为 .1 / .2 ... 备份。
+    """
+    def __init__(self, log_dir: str, flush_interval: float = 5, batch_size: int = 50,
+                 max_bytes: int = 1024 * 1024, backup_count: int = 3):
+        self.log_dir = log_dir
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        os.makedirs(self.log_dir, exist_ok=True)
+
+        self.pending: Dict[str, List[str]] = {}
+        self.pending_count = 0
+        self._flush_lock = asyncio.Lock()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def _get_log_path(self, group_key: str) -> str:
+        safe_key = re.sub(r"[^0-9A-Za-z_\-]", "_", str(group_key))
+        return os.path.join(self.log_dir, f"{safe_key}.log")
+
+    def record(self, group_key: str, entry: dict):
+        """写入一条记录到内存缓冲 (不阻塞)"""
+        line = json.dumps(entry, ensure_ascii=False, separators=(",", ":"))
+        self.pending.setdefault(group_key, []).append(line)
+        self.pending_count += 1
+
+        # 后台刷盘任务需要事件循环，因此在首条记录时惰性启动
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._flush_loop())
+        if self.pending_count >= self.batch_size:
+            self._wakeup.set()
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Failed to flush roll audit log: {e}")
+
+    async def flush(self, group_key: Optional[str] = None):
+        """将缓冲写入文件；指定 group_key 时只刷该群"""
+        async with self._flush_lock:
+            keys = [group_key] if group_key is not None else list(self.pending.keys())
+            for key in keys:
+                lines = self.pending.pop(key, None)
+                if not lines:
+                    continue
+                self.pending_count -= len(lines)
+                payload = ("\n".join(lines) + "\n").encode("utf-8")
+                path = self._get_log_path(key)
+                self._rotate_if_needed(path, len(payload))
+                async with aiofiles.open(path, "ab") as f:
+                    await f.write(payload)
+
+    def _rotate_if_needed(self, path: str, incoming: int):
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return
+        if size == 0 or size + incoming <= self.max_bytes:
+            return
+        for i in range(self.backup_count - 1, 0, -1):
+            src = f"{path}.{i}"
+            if os.path.exists(src):
+                os.replace(src, f"{path}.{i + 1}")
+        if self.backup_count > 0:
+            os.replace(path, f"{path}.1")
+        else:
+            os.remove(path)
+
+    async def tail(self, group_key: str, limit: int = 10) -> List[dict]:
+        """读取某群最近 limit 条记录 (从文件尾部倒读，不加载整个文件)"""
+        await self.flush(group_key)
+        path = self._get_log_path(group_key)
+        lines: List[bytes] = []
+        candidates = [path] + [f"{path}.{i}" for i in range(1, self.backup_count + 1)]
+        for file_path in candidates:
+            if len(lines) >= limit or not os.path.exists(file_path):
+                break
+            older = await self._read_tail_lines(file_path, limit - len(lines))
+            lines = older + lines
+
+        entries = []
+        for raw in lines:
+            try:
+                entries.append(json.loads(raw))
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                continue
+        return entries
+
+    @staticmethod
+    async def _read_tail_lines(path: str, limit: int, block_size: int = 4096) -> List[bytes]:
+        async with aiofiles.open(path, "rb") as f:
+            await f.seek(0, os.SEEK_END)
+            pos = await f.tell()
+            data = b""
+            # 多读一行，保证最前面那行是完整的
+            while pos > 0 and data.count(b"\n") <= limit:
+                step = min(block_size, pos)
+                pos -= step
+                await f.seek(pos)
+                data = await f.read(step) + data
+        chunks = data.split(b"\n")
+        if pos > 0:
+            chunks = chunks[1:]
+        lines = [line for line in chunks if line.strip()]
+        return lines[-limit:]
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+
+class LuckStats:
+    """
+    玩家运势统计 (增量聚合)
+    每个用户、每张人物卡维护计数/和/平方和与成功等级计数器，
+    每次掷骰 O(1) 更新，定期整体写回单个 JSON 文件，查询直接读内存。
+    """
+    TIERS = ("critical_success", "extreme_success", "hard_success", "success", "failure", "fumble")
+
+    def __init__(self, path: str, flush_interval: float = 30):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.data: Dict[str, dict] = {}
+        self.dirty = False
+        self._task: Optional[asyncio.Task] = None
+
+    def _read(self) -> Dict[str, dict]:
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    async def load(self):
+        """在线程中读取历史统计 (由插件启动预热调用，须先于任何更新完成)"""
+        try:
+            self.data = await asyncio.to_thread(self._read)
+        except Exception as e:
+            logger.error(f"Failed to load luck stats: {e}")
+
+    @classmethod
+    def _new_agg(cls) -> dict:
+        return {
+            "n": 0, "sum": 0, "sq": 0,
+            "checks": 0, "tiers": {k: 0 for k in cls.TIERS},
+            "san_checks": 0, "san_lost": 0,
+        }
+
+    def _buckets(self, user_id: str, chara_id: Optional[str], chara_name: Optional[str]) -> List[dict]:
+        """返回需要更新的聚合桶: 用户总计，以及 (若有) 当前人物卡"""
+        user = self.data.setdefault(str(user_id), {"total": self._new_agg(), "characters": {}})
+        buckets = [user["total"]]
+        if chara_id:
+            chara = user["characters"].setdefault(chara_id, self._new_agg())
+            if chara_name:
+                chara["name"] = chara_name
+            buckets.append(chara)
+
+        self.dirty = True
+        # 后台落盘任务需要事件循环，因此在首次更新时惰性启动
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._flush_loop())
+        return buckets
+
+    def record_d100(self, user_id: str, chara_id: Optional[str], value: int, chara_name: Optional[str] = None):
+        for agg in self._buckets(user_id, chara_id, chara_name):
+            agg["n"] += 1
+            agg["sum"] += value
+            agg["sq"] += value * value
+
+    def record_check(self, user_id: str, chara_id: Optional[str], tier: str, chara_name: Optional[str] = None):
+        for agg in self._buckets(user_id, chara_id, chara_name):
+            agg["checks"] += 1
+            agg["tiers"][tier] = agg["tiers"].get(tier, 0) + 1
+
+    def record_san_loss(self, user_id: str, chara_id: Optional[str], loss: int, chara_name: Optional[str] = None):
+        for agg in self._buckets(user_id, chara_id, chara_name):
+            agg["san_checks"] += 1
+            agg["san_lost"] += loss
+
+    def get_user(self, user_id: str) -> Optional[dict]:
+        return self.data.get(str(user_id))
+
+    @staticmethod
+    def summarize(agg: dict) -> dict:
+        """由聚合值计算均值、标准差与各项比率"""
+        n, checks = agg["n"], agg["checks"]
+        mean = agg["sum"] / n if n else 0.0
+        variance = max(0.0, agg["sq"] / n - mean * mean) if n else 0.0
+        tiers = agg["tiers"]
+        successes = sum(tiers.get(k, 0) for k in ("critical_success", "extreme_success", "hard_success", "success"))
+        return {
+            "d100_count": n,
+            "d100_mean": mean,
+            "d100_std": variance ** 0.5,
+            "checks": checks,
+            "success_rate": successes / checks if checks else 0.0,
+            "critical_rate": tiers.get("critical_success", 0) / checks if checks else 0.0,
+            "fumble_rate": tiers.get("fumble", 0) / checks if checks else 0.0,
+            "san_checks": agg["san_checks"],
+            "san_lost": agg["san_lost"],
+        }
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Failed to save luck stats: {e}")
+
+    async def flush(self):
+        if not self.dirty:
+            return
+        self.dirty = False
+        content = json.dumps(self.data, ensure_ascii=False, separators=(",", ":"))
+        tmp_path = f"{self.path}.tmp"
+        async with aiofiles.open(tmp_path, "w", encoding="utf-8") as f:
+            await f.write(content)
+        os.replace(tmp_path, self.path)
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+
+class RenderCache:
+    """
+    图片渲染缓存
+    以 (模板名, 数据) 的内容哈希为键缓存渲染结果，相同内容只渲染一次；
+    同一内容的并发请求共享同一次渲染，信号量限制同时进行的渲染数量。
+    渲染结果统一取本地文件路径，文件被清理后缓存自动失效。
+    """
+    def __init__(self, render_func, max_concurrency: int = 2, max_entries: int = 128):
+        self.render_func = render_func
+        self.semaphore = asyncio.Semaphore(max(1, max_concurrency))
+        self.max_entries = max_entries
+        self.cache: "OrderedDict[str, str]" = OrderedDict()
+        self.inflight: Dict[str, asyncio.Future] = {}
+
+    @staticmethod
+    def content_hash(template_name: str, data: dict) -> str:
+        payload = json.dumps(data, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(f"{template_name}\n{payload}".encode("utf-8")).hexdigest()
+
+    def _get_cached(self, key: str) -> Optional[str]:
+        path = self.cache.get(key)
+        if path is None:
+            return None
+        # 本地文件可能已被清理，此时视为未命中
+        if not os.path.exists(path):
+            del self.cache[key]
+            return None
+        self.cache.move_to_end(key)
+        return path
+
+    async def render(self, template_name: str, data: dict) -> str:
+        key = self.content_hash(template_name, data)
+        while True:
+            path = self._get_cached(key)
+            if path:
+                return path
+            inflight = self.inflight.get(key)
+            if inflight is None:
+                break
+            try:
+                return await asyncio.shield(inflight)
+            except asyncio.CancelledError:
+                # 负责渲染的任务被取消时由当前请求重新渲染；若是当前任务自身被取消则照常抛出
+                if not inflight.cancelled():
+                    raise
+
+        future = asyncio.get_running_loop().create_future()
+        self.inflight[key] = future
+        try:
+            async with self.semaphore:
+                path = await self.render_func(
+                    RENDER_TEMPLATES[template_name], data, return_url=False, options={"full_page": True}
+                )
+            self.cache[key] = path
+            if len(self.cache) > self.max_entries:
+                self.cache.popitem(last=False)
+            future.set_result(path)
+            return path
+        except Exception as e:
+            future.set_exception(e)
+            # 没有其他等待者时取走异常，避免 "exception was never retrieved" 警告
+            future.exception()
+            raise
+        finally:
+            # 被取消 (CancelledError) 等未被上面捕获的退出路径也要唤醒等待者
+            if not future.done():
+                future.cancel()
+            del self.inflight[key]
+
 # ================= 古典风格帮助菜单模版 (去联网稳定版) =================
 HELP_HTML_TEMPLATE = """
 <!DOCTYPE html>
@@ -158,7 +764,7 @@ HELP_HTML_TEMPLATE = """
             <div class="true-random-desc">
                 本插件核心掷骰逻辑集成了大气噪声真随机源。
                 <br>每一次命运的判定，都来自宇宙深处的混沌涨落，而非伪随机算法的平庸重复。
-                <br>(当网络连接不稳定时，将自动降级至标准伪随机模式)
+                <br>(当网络连接不稳定时，将自动切换备用熵源，最终降级至本地密码学安全随机数)
             </div>
         </div>
 
@@ -168,6 +774,75 @@ HELP_HTML_TEMPLATE = """
 </html>
 """
 
+# ================= 结果卡片模版 (人物卡 / 多行结果) =================
+CARD_BASE_STYLE = """
+        body {
+            margin: 0; padding: 20px; background-color: transparent;
+            font-family: 'Songti SC', 'SimSun', 'Times New Roman', 'Noto Serif SC', serif;
+            width: fit-content;
+        }
+        .parchment {
+            background-color: #f3e5ce;
+            background-image: radial-gradient(circle at center, #f8f1e0 0%, #f3e5ce 80%, #e6d2b0 100%);
+            padding: 30px 40px; border: 8px double #5c4033; border-radius: 6px;
+            box-shadow: 8px 8px 20px rgba(0,0,0,0.35); min-width: 480px; max-width: 900px; color: #43302b;
+        }
+        .title { font-size: 32px; font-weight: bold; color: #2c1e1a; border-bottom: 2px solid #5c4033; padding-bottom: 10px; margin-bottom: 16px; }
+        .subtitle { font-size: 18px; color: #7a6256; font-style: italic; margin-left: 12px; font-weight: normal; }
+"""
+
+SHEET_HTML_TEMPLATE = """
+<!DOCTYPE html>
+<html lang="zh-CN">
+<head>
+    <meta charset="UTF-8">
+    <style>
+""" + CARD_BASE_STYLE + """
+        .grid { display: grid; grid-template-columns: repeat(3, 1fr); gap: 8px 24px; }
+        .attr { display: flex; justify-content: space-between; font-size: 22px; border-bottom: 1px dashed #d1c0a5; padding: 4px 0; }
+        .attr-name { color: #5c4033; }
+        .attr-value { font-family: 'Consolas', 'Courier New', monospace; font-weight: bold; color: #8b0000; }
+    </style>
+</head>
+<body>
+    <div class="parchment">
+        <div class="title">📜 {{ name }}<span class="subtitle">ID: ...{{ short_id }}</span></div>
+        <div class="grid">
+            {% for attr in attributes %}
+            <div class="attr"><span class="attr-name">{{ attr.key }}</span><span class="attr-value">{{ attr.value }}</span></div>
+            {% endfor %}
+        </div>
+    </div>
+</body>
+</html>
+"""
+
+RESULT_HTML_TEMPLATE = """
+<!DOCTYPE html>
+<html lang="zh-CN">
+<head>
+    <meta charset="UTF-8">
+    <style>
+""" + CARD_BASE_STYLE + """
+        .line { font-size: 22px; padding: 6px 0; border-bottom: 1px dashed #d1c0a5; white-space: pre-wrap; }
+    </style>
+</head>
+<body>
+    <div class="parchment">
+        <div class="title">{{ title }}</div>
+        {% for line in lines %}
+        <div class="line">{{ line }}</div>
+        {% endfor %}
+    </div>
+</body>
+</html>
+"""
+
+RENDER_TEMPLATES = {
+    "sheet": SHEET_HTML_TEMPLATE,
+    "result": RESULT_HTML_TEMPLATE,
+}
+
 @register("astrbot_plugin_TRPG", "shiroling", "TRPG玩家用骰 (Refactored)", "1.2.7")
 class DicePlugin(Star):
     def __init__(self, context: Context, config: AstrBotConfig):
@@ -178,33 +853,173 @@ class DicePlugin(Star):
         self.chara_data_dir = os.path.join(self.data_root, "chara_data")
         os.makedirs(self.chara_data_dir, exist_ok=True)
         
-        self.phobias: Dict[str, str] = {}
-        self.manias: Dict[str, str] = {}
-        self._load_static_resources()
+        # 用户人物卡索引缓存 {user_id: {name: id}}，避免每次都扫描目录
+        self.card_index: Dict[str, Dict[str, str]] = {}
+
+        # 静态表按点数直接索引: phobias[roll - 1]，由后台预热任务加载
+        self.phobias: Tuple[str, ...] = ()
+        self.manias: Tuple[str, ...] = ()
+        # 静态表与持久化数据 (队伍、运势统计) 的加载任务，相关指令执行前等待它
+        self._resources_task: Optional[asyncio.Task] = None
+        self._warmup_task: Optional[asyncio.Task] = None
         
         # 初始化真随机管理器
         self.rng_manager = None
         if self.config.get("enable_true_random", True):
             buffer_size = self.config.get("true_random_buffer_size", 100)
-            self.rng_manager = TrueRandomManager(buffer_size=buffer_size)
+            self.rng_manager = TrueRandomManager(
+                providers=self._build_entropy_providers(),
+                buffer_size=buffer_size,
+                failure_threshold=self.config.get("entropy_failure_threshold", 3),
+                cooldown=self.config.get("entropy_cooldown", 60),
+                hedge=self.config.get("enable_hedged_refill", True),
+            )
+
+        # 初始化掷骰审计日志
+        self.audit_log = None
+        if self.config.get("enable_audit_log", False):
+            self.audit_log = RollAuditLog(
+                log_dir=os.path.join(self.data_root, "audit_log"),
+                flush_interval=self.config.get("audit_flush_interval", 5),
+                max_bytes=self.config.get("audit_max_file_kb", 1024) * 1024,
+                backup_count=self.config.get("audit_backup_count", 3),
+            )
 
-    def _load_static_resources(self):
-        """加载静态资源文件"""
+        # 各群登记的队伍 {group_id: {user_id: 昵称}}
+        self.parties_path = os.path.join(self.data_root, "parties.json")
+        self.parties: Dict[str, Dict[str, str]] = {}
+
+        # 初始化运势统计
+        self.luck_stats = None
+        if self.config.get("enable_luck_stats", True):
+            self.luck_stats = LuckStats(
+                path=os.path.join(self.data_root, "luck_stats.json"),
+                flush_interval=self.config.get("stats_flush_interval", 30),
+            )
+
+        # 图片卡片输出 (可选)
+        self.render_cache = None
+        if self.config.get("enable_image_output", False):
+            self.render_cache = RenderCache(
+                self.html_render,
+                max_concurrency=self.config.get("render_concurrency", 2),
+                max_entries=self.config.get("render_cache_size", 128),
+            )
+
+        # 预热放到后台，不阻塞插件注册；没有运行中的事件循环时推迟到首次使用
         try:
-            phobia_path = os.path.join(PLUGIN_DIR, "phobias.json")
-            if os.path.exists(phobia_path):
-                with open(phobia_path, "r", encoding="utf-8") as f:
-                    self.phobias = json.load(f).get("phobias", {})
-            
-            mania_path = os.path.join(PLUGIN_DIR, "mania.json")
-            if os.path.exists(mania_path):
-                with open(mania_path, "r", encoding="utf-8") as f:
-                    self.manias = json.load(f).get("manias", {})
-            
+            self._start_warm_up()
+        except RuntimeError:
+            pass
+
+    def _build_entropy_providers(self) -> List[EntropyProvider]:
+        """按配置顺序构建熵源列表，本地 CSPRNG 始终作为兜底存在"""
+        timeout = self.config.get("entropy_request_timeout", 10)
+        providers: List[EntropyProvider] = []
+        for name in self.config.get("entropy_providers", ["random_org", "http"]):
+            name = str(name).strip()
+            if name == "random_org":
+                providers.append(RandomOrgProvider(timeout=timeout))
+            elif name == "http":
+                url = str(self.config.get("entropy_http_url", "")).strip()
+                if url:
+                    providers.append(HttpEntropyProvider(url, timeout=timeout))
+            elif name == "local":
+                providers.append(LocalCSPRNGProvider())
+            else:
+                logger.warning(f"Unknown entropy provider: {name}")
+        if not any(p.is_local for p in providers):
+            providers.append(LocalCSPRNGProvider())
+        return providers
+
+    # ================= 启动预热 =================
+
+    def _start_warm_up(self):
+        """
+        启动预热任务 (需在事件循环中调用)。
+        静态表与持久化数据单独成一个任务，供依赖它们的指令等待；
+        人物卡索引与首次熵源补充只在后台进行，不会拖慢任何指令。
+        """
+        loop = asyncio.get_running_loop()
+        self._resources_task = loop.create_task(self._load_static_resources())
+        self._warmup_task = loop.create_task(self._warm_up())
+
+    async def _warm_up(self):
+        """后台预热: 为最近活跃的用户建立人物卡索引、发起首次熵源补充，单项失败不影响其他项"""
+        tasks = [self._prebuild_card_indexes()]
+        if self.rng_manager:
+            tasks.append(self.rng_manager._refill_buffer())
+        for result in await asyncio.gather(*tasks, return_exceptions=True):
+            if isinstance(result, Exception):
+                logger.error(f"TRPG warm-up step failed: {result}")
+
+    async def _ensure_resources(self):
+        """等待静态表与持久化数据加载完成 (插件在无事件循环时加载的情况下，由首个指令触发预热)"""
+        if self._resources_task is None:
+            self._start_warm_up()
+        if not self._resources_task.done():
+            await asyncio.shield(self._resources_task)
+
+    @staticmethod
+    def _read_indexed_table(path: str, key: str) -> Tuple[str, ...]:
+        """读取 {"key": {"1": ..., "2": ...}} 形式的表，转为按点数下标访问的元组"""
+        if not os.path.exists(path):
+            return ()
+        with open(path, "r", encoding="utf-8") as f:
+            table = json.load(f).get(key, {})
+        numbered = {int(k): v for k, v in table.items() if str(k).isdigit()}
+        if not numbered:
+            return ()
+        return tuple(numbered.get(i, "") for i in range(1, max(numbered) + 1))
+
+    async def _load_static_resources(self):
+        """在线程中加载静态表、队伍登记与运势统计，避免阻塞插件注册与事件循环"""
+        tasks = [self._load_tables(), self._load_parties()]
+        if self.luck_stats:
+            tasks.append(self.luck_stats.load())
+        await asyncio.gather(*tasks)
+
+    async def _load_tables(self):
+        try:
+            self.phobias, self.manias = await asyncio.gather(
+                asyncio.to_thread(self._read_indexed_table, os.path.join(PLUGIN_DIR, "phobias.json"), "phobias"),
+                asyncio.to_thread(self._read_indexed_table, os.path.join(PLUGIN_DIR, "mania.json"), "manias"),
+            )
             logger.info(f"TRPG Resources Loaded: {len(self.phobias)} phobias, {len(self.manias)} manias.")
         except Exception as e:
             logger.error(f"Failed to load TRPG static resources: {e}")
 
+    def _read_parties(self) -> Dict[str, Dict[str, str]]:
+        if not os.path.exists(self.parties_path):
+            return {}
+        with open(self.parties_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    async def _load_parties(self):
+        try:
+            self.parties = await asyncio.to_thread(self._read_parties)
+        except Exception as e:
+            logger.error(f"Failed to load parties: {e}")
+
+    def _recent_user_ids(self, limit: int) -> List[str]:
+        """按人物卡目录中最近的修改时间挑出最活跃的用户"""
+        activity = []
+        for entry in os.scandir(self.chara_data_dir):
+            if not entry.is_dir():
+                continue
+            latest = max((f.stat().st_mtime for f in os.scandir(entry.path) if f.is_file()), default=0)
+            activity.append((latest, entry.name))
+        activity.sort(reverse=True)
+        return [uid for _, uid in activity[:limit]]
+
+    async def _prebuild_card_indexes(self):
+        limit = self.config.get("warmup_user_count", 20)
+        if limit <= 0:
+            return
+        user_ids = await asyncio.to_thread(self._recent_user_ids, limit)
+        await asyncio.gather(*(self._get_all_characters(uid) for uid in user_ids))
+        logger.info(f"TRPG card indexes warmed for {len(user_ids)} users.")
+
     # ================= 异步文件操作 =================
     
     def _get_user_folder(self, user_id: str) -> str:
@@ -220,7 +1035,11 @@ class DicePlugin(Star):
         return os.path.join(self._get_user_folder(user_id), "current.txt")
 
     async def _get_all_characters(self, user_id: str) -> Dict[str, str]:
-        """获取用户所有人物卡 {name: id}"""
+        """获取用户所有人物卡 {name: id} (首次扫描目录后缓存索引)"""
+        cached = self.card_index.get(str(user_id))
+        if cached is not None:
+            return dict(cached)
+
         folder = self._get_user_folder(user_id)
         characters = {}
         try:
@@ -238,7 +1057,15 @@ class DicePlugin(Star):
                         continue
         except Exception as e:
             logger.error(f"Error listing characters for {user_id}: {e}")
-        return characters
+            return characters
+        self.card_index[str(user_id)] = characters
+        return dict(characters)
+
+    def _index_character(self, user_id: str, data: dict):
+        """新建人物卡后同步更新索引缓存 (索引尚未建立时无需处理)"""
+        index = self.card_index.get(str(user_id))
+        if index is not None:
+            index[data["name"]] = data["id"]
 
     async def _get_current_character_id(self, user_id: str) -> Optional[str]:
         path = self._get_current_ref_path(user_id)
@@ -276,103 +1103,298 @@ class DicePlugin(Star):
             return await self._load_character_data(user_id, cid)
         return None
 
+    async def _save_parties(self):
+        async with aiofiles.open(self.parties_path, "w", encoding="utf-8") as f:
+            await f.write(json.dumps(self.parties, indent=4, ensure_ascii=False))
+
+    async def _load_party_cards(self, group_id: str) -> List[Tuple[str, str, Optional[dict]]]:
+        """并发加载队伍中每个成员的当前人物卡，返回 [(user_id, 昵称, 人物卡或 None)]"""
+        await self._ensure_resources()
+        members = list(self.parties.get(str(group_id), {}).items())
+        cards = await asyncio.gather(*(self._get_current_character(uid) for uid, _ in members))
+        return [(uid, nick, card) for (uid, nick), card in zip(members, cards)]
+
+    async def _save_character_batch(self, cards: List[Tuple[str, dict]]):
+        """一次性并发写回多张人物卡 [(user_id, 人物卡)]"""
+        await asyncio.gather(*(self._save_character_data(uid, card["id"], card) for uid, card in cards))
+
+    # ================= 图片输出 =================
+
+    async def _lines_result(self, event: AstrMessageEvent, lines: List[str]):
+        """
+        多行结果: 未启用图片输出或行数未达阈值时返回纯文本，否则渲染为图片卡片。
+        lines[0] 作为标题；渲染失败时回退为纯文本。
+        """
+        text = "\n".join(lines)
+        if not self.render_cache or len(lines) < self.config.get("image_min_lines", 6):
+            return event.plain_result(text)
+        data = {
+            "title": lines[0].replace("**", ""),
+            "lines": [line.replace("**", "") for line in lines[1:]],
+        }
+        try:
+            return event.image_result(await self.render_cache.render("result", data))
+        except Exception as e:
+            logger.warning(f"Render result image failed, fallback to text: {e}")
+            return event.plain_result(text)
+
+    # ================= 审计日志 =================
+
+    def _audit(self, event: AstrMessageEvent, kind: str, expression: str, trace: list, result: Any, hidden: bool = False):
+        """
+        记录一次掷骰到审计日志 (未启用时直接跳过)。
+        trace 为 _roll_single 收集的 [面数, 点数, 熵源] 列表。
+        """
+        if not self.audit_log:
+            return
+        group_id = event.message_obj.group_id
+        group_key = str(group_id) if group_id else f"private_{event.get_sender_id()}"
+        entry = {
+            "t": int(time.time()),
+            "g": str(group_id or ""),
+            "u": str(event.get_sender_id()),
+            "n": event.get_sender_name(),
+            "k": kind,
+            "e": expression,
+            "d": [[faces, value] for faces, value, _ in trace],
+            "s": sorted({source for _, _, source in trace}),
+            "r": result,
+        }
+        if hidden:
+            entry["h"] = 1
+        self.audit_log.record(group_key, entry)
+
+    async def terminate(self):
+        """插件卸载时刷新尚未落盘的审计记录与统计"""
+        if self.audit_log:
+            await self.audit_log.close()
+        if self.luck_stats:
+            await self.luck_stats.close()
+
+    # ================= 运势统计 =================
+
+    async def _update_stats(self, user_id: str, d100_rolls: List[int], tiers: List[str] = (),
+                            san_loss: Optional[int] = None, chara: Optional[dict] = None):
+        """
+        将一次指令的结果计入运势统计。
+        chara 为已加载的人物卡；未传入时只读取当前卡 ID，不加载整张卡。
+        """
+        if not self.luck_stats or not (d100_rolls or tiers or san_loss is not None):
+            return
+        await self._ensure_resources()
+        if chara:
+            chara_id, chara_name = chara["id"], chara["name"]
+        else:
+            chara_id, chara_name = await self._get_current_character_id(user_id), None
+
+        for value in d100_rolls:
+            self.luck_stats.record_d100(user_id, chara_id, value, chara_name)
+        for tier in tiers:
+            self.luck_stats.record_check(user_id, chara_id, tier, chara_name)
+        if san_loss is not None:
+            self.luck_stats.record_san_loss(user_id, chara_id, san_loss, chara_name)
+
     # ================= 核心骰子逻辑 =================
 
-    async def _roll_single(self, faces: int) -> int:
+    async def _roll_single(self, faces: int, trace: Optional[list] = None) -> int:
         """
         掷单个骰子，使用真随机源。
         公式: floor(fraction * faces) + 1
+        传入 trace 时追加 (面数, 点数, 熵源) 供审计使用。
         """
         if self.rng_manager:
-            fraction = await self.rng_manager.get_fraction()
-            return int(fraction * faces) + 1
+            fraction, source = await self.rng_manager.draw()
+            value = int(fraction * faces) + 1
         else:
-            return random.randint(1, faces)
+            value, source = random.randint(1, faces), "pseudo"
+        if trace is not None:
+            trace.append((faces, value, source))
+        return value
 
-    async def _roll_multi(self, count: int, faces: int) -> List[int]:
+    async def _roll_multi(self, count: int, faces: int, trace: Optional[list] = None) -> List[int]:
         max_dice = self.config.get("max_dice_count", 50)
         # 限制最大骰子数，防止 DoS
         count = min(count, max_dice)
-        # 串行获取随机数（因为 get_fraction 内部是非阻塞的）
-        return [await self._roll_single(faces) for _ in range(count)]
+        return await self._roll_batch(count, faces, trace)
+
+    async def _roll_batch(self, count: int, faces: int, trace: Optional[list] = None) -> List[int]:
+        """一次性从随机源取出 count 个数并掷成同面数的骰子 (不做数量限制)"""
+        if self.rng_manager:
+            draws = await self.rng_manager.draw_many(count)
+            rolls = [(int(fraction * faces) + 1, source) for fraction, source in draws]
+        else:
+            rolls = [(random.randint(1, faces), "pseudo") for _ in range(count)]
+        if trace is not None:
+            trace.extend((faces, value, source) for value, source in rolls)
+        return [value for value, _ in rolls]
 
-    async def _safe_parse_dice(self, expression: str) -> Tuple[Optional[int], str]:
+    def _compile_dice_expression(self, expression: str) -> Tuple[Optional[List[tuple]], str]:
         """
-        解析并执行简单的骰子表达式。
-        支持: NdM, +, -, *, 纯数字, k(Keep)
+        将骰子表达式拆分为项，不掷骰。
+        项: ("dice", 符号, 个数, 面数, 保留数) / ("prod", 符号, [因数]) / ("num", 符号, 数字串)
         """
         expression = expression.lower().replace(" ", "")
         if not re.match(r"^[0-9d+\-*k]+$", expression):
             return None, "表达式含有非法字符"
-        
-        safe_expr = expression.replace("-", "+-")
-        parts = safe_expr.split("+")
-        
+
+        max_digits = self.config.get("max_number_digits", 15)
+        terms = []
+        for part in expression.replace("-", "+-").split("+"):
+            if not part: continue
+
+            sign = 1
+            if part.startswith("-"):
+                sign = -1
+                part = part[1:]
+
+            # 先按位数拦截，避免对超长数字串做 int() 转换
+            if any(len(num) > max_digits for num in re.findall(r"\d+", part)):
+                return None, f"数值过大 (单个数字最多 {max_digits} 位)"
+
+            if "d" in part:
+                match = re.match(r"^(\d*)d(\d+)(?:k(\d+))?$", part)
+                if not match:
+                    return None, f"无法解析骰子部分: {part}"
+                count_str, faces_str, keep_str = match.groups()
+                count = int(count_str) if count_str else 1
+                keep = int(keep_str) if keep_str else None
+                terms.append(("dice", sign, count, int(faces_str), keep))
+            elif "*" in part:
+                factors = part.split("*")
+                if not all(f.isdigit() for f in factors):
+                    return None, f"计算错误: 无法解析乘法部分: {part}"
+                terms.append(("prod", sign, factors))
+            else:
+                if not part.isdigit():
+                    return None, f"计算错误: 无法解析: {part or '-'}"
+                terms.append(("num", sign, part))
+        return terms, ""
+
+    @staticmethod
+    def _estimate_dice_cost(terms: List[tuple], repeat: int = 1) -> Dict[str, int]:
+        """
+        静态估算整条表达式 (含 # 复读) 的开销:
+        dice: 骰子总数，即需要消耗的随机数个数; digits: 最大乘积/数字的位数上界;
+        length: 结果文本长度上界。
+        """
+        dice = 0
+        digits = 1
+        length = 0
+        max_total = 0
+        for term in terms:
+            if term[0] == "dice":
+                _, _, count, faces, keep = term
+                dice += count
+                max_total += count * faces
+                face_width = len(str(faces))
+                if count == 1 and keep is None:
+                    length += face_width
+                else:
+                    # "(a + b + ...)" 加上可能的 "选k"
+                    length += count * face_width + 3 * (count - 1) + 2
+                    if keep is not None:
+                        length += len(str(keep)) + 1
+            else:
+                nums = term[2] if term[0] == "prod" else [term[2]]
+                # 乘积的位数不超过各因数位数之和
+                term_digits = sum(max(len(n.lstrip("0")), 1) for n in nums)
+                digits = max(digits, term_digits)
+                length += term_digits
+        # 各项之间的 " + " 与结尾的 " = 总和"
+        total_digits = max(len(str(max_total)), digits) + 1
+        length += 3 * max(len(terms) - 1, 0) + 3 + total_digits
+        return {
+            "dice": dice * repeat,
+            "rng": dice * repeat,
+            "digits": max(digits, total_digits - 1),
+            "length": length * repeat,
+        }
+
+    def _check_dice_budget(self, expression: str, repeat: int = 1) -> Tuple[Optional[List[tuple]], str]:
+        """
+        掷骰前的校验: 解析表达式并按配置的预算拒绝过大的请求，
+        通过时返回解析好的项，可直接交给 _eval_dice_terms (复读时重复使用)。
+        """
+        terms, err = self._compile_dice_expression(expression)
+        if terms is None:
+            return None, err
+
+        max_dice = self.config.get("max_dice_count", 50)
+        for term in terms:
+            if term[0] == "dice":
+                if term[2] > max_dice:
+                    return None, f"骰子数量过多 (上限 {max_dice})"
+                if term[3] < 1:
+                    return None, "骰子面数必须大于0"
+
+        cost = self._estimate_dice_cost(terms, repeat)
+        max_total_dice = self.config.get("max_total_dice", 200)
+        if cost["dice"] > max_total_dice:
+            return None, f"骰子总数过多 (共 {cost['dice']} 个，上限 {max_total_dice})"
+        max_digits = self.config.get("max_number_digits", 15)
+        if cost["digits"] > max_digits:
+            return None, f"数值过大 (结果最多 {max_digits} 位)"
+        max_length = self.config.get("max_result_length", 2000)
+        if cost["length"] > max_length:
+            return None, f"结果过长 (约 {cost['length']} 字，上限 {max_length})，请减少骰子数量或复读次数"
+        return terms, ""
+
+    async def _eval_dice_terms(self, terms: List[tuple], trace: Optional[list] = None) -> Tuple[int, str]:
+        """对已通过校验的项掷骰求值"""
         total = 0
         details = []
-        
-        try:
-            for part in parts:
-                if not part: continue
-                
-                sign = 1
-                if part.startswith("-"):
-                    sign = -1
-                    part = part[1:]
-                
-                if "d" in part:
-                    match = re.match(r"^(\d*)d(\d+)(?:k(\d+))?$", part)
-                    if not match: 
-                        return None, f"无法解析骰子部分: {part}"
-                    
-                    count_str, faces_str, keep_str = match.groups()
-                    count = int(count_str) if count_str else 1
-                    faces = int(faces_str)
-                    
-                    if count > self.config.get("max_dice_count", 50):
-                        return None, f"骰子数量过多 (上限 {self.config.get('max_dice_count', 50)})"
-                    
-                    rolls = await self._roll_multi(count, faces)
-                    
-                    if keep_str:
-                        keep = int(keep_str)
-                        selected = sorted(rolls, reverse=True)[:keep]
-                        subtotal = sum(selected)
-                        details.append(f"({' + '.join(map(str, rolls))})选{keep}")
-                    else:
-                        subtotal = sum(rolls)
-                        if len(rolls) == 1:
-                             details.append(f"{subtotal}")
-                        else:
-                             details.append(f"({' + '.join(map(str, rolls))})")
-                    
-                    total += subtotal * sign
-                
-                elif "*" in part:
-                    factors = part.split("*")
-                    sub_prod = 1
-                    for f in factors:
-                        sub_prod *= int(f)
-                    total += sub_prod * sign
-                    details.append(str(sub_prod))
-                    
+
+        for term in terms:
+            kind, sign = term[0], term[1]
+            if kind == "dice":
+                _, _, count, faces, keep = term
+                rolls = await self._roll_multi(count, faces, trace)
+
+                if keep is not None:
+                    selected = sorted(rolls, reverse=True)[:keep]
+                    subtotal = sum(selected)
+                    details.append(f"({' + '.join(map(str, rolls))})选{keep}")
                 else:
-                    val = int(part)
-                    total += val * sign
-                    details.append(str(val))
-                    
-        except Exception as e:
-            return None, f"计算错误: {str(e)}"
-        
+                    subtotal = sum(rolls)
+                    if len(rolls) == 1:
+                         details.append(f"{subtotal}")
+                    else:
+                         details.append(f"({' + '.join(map(str, rolls))})")
+
+                total += subtotal * sign
+
+            elif kind == "prod":
+                sub_prod = 1
+                for f in term[2]:
+                    sub_prod *= int(f)
+                total += sub_prod * sign
+                details.append(str(sub_prod))
+
+            else:
+                val = int(term[2])
+                total += val * sign
+                details.append(str(val))
+
         if not details:
             return 0, "0"
-        
+
         expr_str = " + ".join(details).replace("+ -", "- ")
         if expr_str == str(total):
             return total, str(total)
-            
+
         return total, f"{expr_str} = {total}"
 
+    async def _safe_parse_dice(self, expression: str, trace: Optional[list] = None) -> Tuple[Optional[int], str]:
+        """
+        解析并执行简单的骰子表达式。
+        支持: NdM, +, -, *, 纯数字, k(Keep)
+        掷骰前先整体校验开销，超出预算时不消耗任何随机数。
+        """
+        terms, err = self._check_dice_budget(expression)
+        if terms is None:
+            return None, err
+        return await self._eval_dice_terms(terms, trace)
+
     # ================= 指令处理 Handlers =================
 
     @filter.command("roll", alias={"r", "掷骰"})
@@ -394,6 +1416,8 @@ class DicePlugin(Star):
                     flavor = f"\n「{random.choice(flavor_pool)}」"
             return f"{result_data['emoji']} {result_data['desc']}{flavor}"
 
+        trace = []
+
         # 复读模式
         if "#" in expression:
             try:
@@ -404,21 +1428,31 @@ class DicePlugin(Star):
                 if not (1 <= count <= 10):
                     yield event.plain_result("⚠️ 复读次数应在 1-10 之间。")
                     return
+
+                terms, err = self._check_dice_budget(expr_part, repeat=count)
+                if terms is None:
+                    yield event.plain_result(f"⚠️ 解析失败: {err}")
+                    return
                 
                 lines = []
+                totals = []
+                tiers = []
                 for i in range(count):
-                    total, desc = await self._safe_parse_dice(expr_part)
-                    if total is None:
-                        yield event.plain_result(f"⚠️ 第 {i+1} 次解析失败: {desc}")
-                        return
+                    total, desc = await self._eval_dice_terms(terms, trace)
                     
                     line = f"🎲 {i+1}: {desc}"
                     if target is not None:
+                        tiers.append(self._get_check_result(total, target)["key"])
                         check_msg = await get_check_message(total, target)
                         line += f" 判定({target}): {check_msg.split(' ')[0]}" # 复读模式只显示 emoji
                     lines.append(line)
+                    totals.append(total)
                 
-                yield event.plain_result("\n".join(lines))
+                self._audit(event, "r", expression, trace, totals)
+                await self._update_stats(event.get_sender_id(), [v for f, v, _ in trace if f == 100], tiers)
+                if self.render_cache and count >= self.config.get("image_min_lines", 6):
+                    lines.insert(0, f"🎲 {user_name} 复读 {expression}")
+                yield await self._lines_result(event, lines)
                 return
 
             except (ValueError, IndexError):
@@ -426,10 +1460,13 @@ class DicePlugin(Star):
                 return
 
         # 普通模式
-        total, desc = await self._safe_parse_dice(expression)
+        total, desc = await self._safe_parse_dice(expression, trace)
         if total is None:
             yield event.plain_result(f"⚠️ {desc}")
             return
+        self._audit(event, "r", expression, trace, total)
+        tiers = [self._get_check_result(total, target)["key"]] if target is not None else []
+        await self._update_stats(event.get_sender_id(), [v for f, v, _ in trace if f == 100], tiers)
             
         if target is not None:
             check_msg = await get_check_message(total, target)
@@ -453,7 +1490,9 @@ class DicePlugin(Star):
             yield event.plain_result("错误: 面数必须大于0")
             return
 
-        roll = await self._roll_single(target_faces)
+        trace = []
+        roll = await self._roll_single(target_faces, trace)
+        self._audit(event, "rd", f"1d{target_faces}", trace, roll)
         yield event.plain_result(f"🎲 {event.get_sender_name()} 进行了 1d{target_faces} 投掷: {roll}")
 
     @filter.command("rh", alias={"暗骰"})
@@ -464,6 +1503,7 @@ class DicePlugin(Star):
             expression = f"1d{default_faces}"
 
         result_msg = ""
+        trace = []
         if "#" in expression:
             try:
                 parts = expression.split("#", 1)
@@ -473,23 +1513,29 @@ class DicePlugin(Star):
                 if count > 10:
                     yield event.plain_result("⚠️ 暗骰复读次数太多啦 (上限10)。")
                     return
+
+                terms, err = self._check_dice_budget(expr_part, repeat=count)
+                if terms is None:
+                    yield event.plain_result(f"⚠️ 格式错误: {err}")
+                    return
                     
                 lines = []
+                totals = []
                 for i in range(count):
-                    total, desc = await self._safe_parse_dice(expr_part)
-                    if total is None:
-                        yield event.plain_result(f"⚠️ 格式错误: {desc}")
-                        return
+                    total, desc = await self._eval_dice_terms(terms, trace)
                     lines.append(f"🎲{i+1}: {desc}")
+                    totals.append(total)
+                self._audit(event, "rh", expression, trace, totals, hidden=True)
                 result_msg = f"🎲 暗骰复读 ({count}次):\n" + "\n".join(lines)
             except ValueError:
                 yield event.plain_result("⚠️ 格式错误。")
                 return
         else:
-            total, desc = await self._safe_parse_dice(expression)
+            total, desc = await self._safe_parse_dice(expression, trace)
             if total is None:
                  yield event.plain_result(f"⚠️ 暗骰格式错误: {desc}")
                  return
+            self._audit(event, "rh", expression, trace, total, hidden=True)
             result_msg = f"🎲 暗骰结果: {expression} = {total}"
 
         try:
@@ -523,25 +1569,100 @@ class DicePlugin(Star):
             yield event.plain_result(f"⚠️ 人物卡 **{name}** 已存在！")
             return
             
-        matches = re.findall(r"([\u4e00-\u9fa5a-zA-Z_]+)\s*(\d+)", attributes)
+        matches = ATTRIBUTE_PATTERN.findall(attributes)
         
         if not matches:
              yield event.plain_result("⚠️ 未识别到属性数据，请使用格式：力量50 敏捷60")
              return
              
-        attr_dict = {k: int(v) for k, v in matches}
-        
-        if "hp" in attr_dict and "max_hp" not in attr_dict: attr_dict["max_hp"] = attr_dict["hp"]
-        if "san" in attr_dict and "max_san" not in attr_dict: attr_dict["max_san"] = attr_dict["san"]
-        if "mp" in attr_dict and "max_mp" not in attr_dict: attr_dict["max_mp"] = attr_dict["mp"]
+        attr_dict = _normalize_attributes({k: int(v) for k, v in matches})
         
         chara_id = str(uuid.uuid4())
         data = { "id": chara_id, "name": name, "attributes": attr_dict }
         
         await self._save_character_data(user_id, chara_id, data)
+        self._index_character(user_id, data)
         await self._set_current_character_id(user_id, chara_id)
         yield event.plain_result(f"✅ 人物卡 **{name}** 创建成功并已选中！")
 
+    @st_group.command("import")
+    async def st_import(self, event: AstrMessageEvent, ignore_arg: str = ""):
+        """
+        批量导入人物卡: /st import 后换行，每行一张卡。
+        支持 Dice! 风格 (名字-力量50...)、CSV (需表头 name,力量,...) 与 JSON Lines。
+        """
+        user_id = event.get_sender_id()
+        parts = re.split(r"import", event.message_str, maxsplit=1)
+        text = parts[1] if len(parts) > 1 else ""
+        if not text.strip():
+            yield event.plain_result("⚠️ 请在 /st import 后换行粘贴人物卡，每行一张。")
+            return
+
+        existing = await self._get_all_characters(user_id)
+        max_cards = self.config.get("max_import_cards", 50)
+        new_cards, errors = [], []
+        for line_no, name, result in _iter_card_records(text.splitlines()):
+            if isinstance(result, str):
+                errors.append(f"第{line_no}行: {result}")
+            elif not name:
+                errors.append(f"第{line_no}行: 缺少人物名")
+            elif not result:
+                errors.append(f"第{line_no}行: {name} 未识别到属性")
+            elif name in existing:
+                errors.append(f"第{line_no}行: {name} 已存在，已跳过")
+            elif len(new_cards) >= max_cards:
+                errors.append(f"单次最多导入 {max_cards} 张，其余已忽略")
+                break
+            else:
+                chara_id = str(uuid.uuid4())
+                new_cards.append({"id": chara_id, "name": name, "attributes": _normalize_attributes(result)})
+                existing[name] = chara_id
+
+        if new_cards:
+            await self._save_character_batch([(user_id, card) for card in new_cards])
+            for card in new_cards:
+                self._index_character(user_id, card)
+
+        msg = [f"📥 成功导入 {len(new_cards)} 张人物卡" + (f": {'、'.join(c['name'] for c in new_cards)}" if new_cards else "")]
+        if errors:
+            msg.append("⚠️ 以下内容未导入:")
+            msg.extend(errors[:10])
+            if len(errors) > 10:
+                msg.append(f"... 另有 {len(errors) - 10} 条")
+        yield event.plain_result("\n".join(msg))
+
+    @st_group.command("export")
+    async def st_export(self, event: AstrMessageEvent, ignore_arg: str = ""):
+        """导出全部人物卡为一个 zip 压缩包 (内含 cards.jsonl，可直接 /st import)"""
+        user_id = event.get_sender_id()
+        chars = await self._get_all_characters(user_id)
+        if not chars:
+            yield event.plain_result("📭 你还没有创建过人物卡。")
+            return
+
+        cards = await asyncio.gather(*(self._load_character_data(user_id, cid) for cid in chars.values()))
+        lines = [
+            json.dumps({"name": c["name"], "attributes": c.get("attributes", {})}, ensure_ascii=False)
+            for c in cards if c
+        ]
+
+        export_dir = os.path.join(self.data_root, "exports")
+        os.makedirs(export_dir, exist_ok=True)
+        # 每次导出使用独立文件，避免同一用户并发导出时互相覆盖
+        path = os.path.join(export_dir, f"{user_id}_{uuid.uuid4().hex}.zip")
+
+        def write_archive():
+            with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+                zf.writestr("cards.jsonl", "\n".join(lines) + "\n")
+
+        try:
+            await asyncio.to_thread(write_archive)
+            yield event.chain_result([File(name=f"trpg_cards_{user_id}.zip", file=path)])
+        finally:
+            # 结果发送完成后生成器才会继续执行到这里
+            if os.path.exists(path):
+                os.remove(path)
+
     @st_group.command("show")
     async def st_show(self, event: AstrMessageEvent, ignore_arg: str = ""):
         """显示当前人物卡"""
@@ -551,11 +1672,23 @@ class DicePlugin(Star):
             yield event.plain_result("⚠️ 当前未选中人物卡，请先使用 `/st create` 或 `/st change`。")
             return
             
-        lines = [f"📜 **{data['name']}** (ID: ...{data['id'][-4:]})"]
-        lines.append("-" * 20)
-        
         attrs = data.get("attributes", {})
         sorted_keys = sorted(attrs.keys())
+
+        if self.render_cache:
+            sheet = {
+                "name": data["name"],
+                "short_id": data["id"][-4:],
+                "attributes": [{"key": k, "value": attrs[k]} for k in sorted_keys],
+            }
+            try:
+                yield event.image_result(await self.render_cache.render("sheet", sheet))
+                return
+            except Exception as e:
+                logger.warning(f"Render character sheet failed, fallback to text: {e}")
+
+        lines = [f"📜 **{data['name']}** (ID: ...{data['id'][-4:]})"]
+        lines.append("-" * 20)
         
         chunk_size = 3
         for i in range(0, len(sorted_keys), chunk_size):
@@ -611,11 +1744,14 @@ class DicePlugin(Star):
             operator = value_expr[0]
             calc_part = value_expr[1:]
         
-        change_val, change_desc = await self._safe_parse_dice(calc_part)
+        trace = []
+        change_val, change_desc = await self._safe_parse_dice(calc_part, trace)
         
         if change_val is None:
             yield event.plain_result(f"⚠️ 数值解析错误: {change_desc}")
             return
+        if trace:
+            self._audit(event, "st", f"{attr} {value_expr}", trace, change_val)
             
         old_val = current_val
         new_val = 0
@@ -679,18 +1815,27 @@ class DicePlugin(Star):
         }
 
     @filter.command("ra")
-    async def roll_check(self, event: AstrMessageEvent, attr_or_target: Union[str, int] = None, target_val: int = None):
-        """技能检定 /ra [技能名] [目标值] 或 /ra [目标值]"""
+    async def roll_check(self, event: AstrMessageEvent, attr_or_target: Union[str, int] = None, target_val: Union[int, str] = None):
+        """技能检定 /ra [技能名] [目标值] 或 /ra [目标值]，/ra all [技能名] 全队检定"""
         user_name = event.get_sender_name()
+
+        if attr_or_target == "all":
+            async for result in self._party_check(event, target_val):
+                yield result
+            return
         
         # 1. 处理无参数情况: 仅投掷 1d100
+        trace = []
         if attr_or_target is None:
-            roll = await self._roll_single(100)
+            roll = await self._roll_single(100, trace)
+            self._audit(event, "ra", "1d100", trace, roll)
+            await self._update_stats(event.get_sender_id(), [roll])
             yield event.plain_result(f"🎲 {user_name} 进行了 1d100 投掷: {roll}")
             return
 
         target = None
         skill_name = "检定"
+        card = None
 
         # 2. 尝试解析参数
         is_direct_number = isinstance(attr_or_target, int) or (isinstance(attr_or_target, str) and attr_or_target.isdigit())
@@ -700,23 +1845,29 @@ class DicePlugin(Star):
             skill_name = "数值"
         elif target_val is None:
             skill_name = str(attr_or_target)
-            card = self._get_current_card(event)
+            card = await self._get_current_character(event.get_sender_id())
             if not card:
                 yield event.plain_result(f"错误: 当前未选中人物卡，请使用 /ra [属性] [数值] 或直接输入数值。")
                 return
-            target = card.get(skill_name)
+            target = card.get("attributes", {}).get(skill_name)
             if target is None:
                 yield event.plain_result(f"错误: 人物卡中未找到属性 '{skill_name}'")
                 return
         else:
             skill_name = str(attr_or_target)
-            target = target_val
+            try:
+                target = int(target_val)
+            except ValueError:
+                yield event.plain_result("错误: 目标值必须是整数")
+                return
 
         # 3. 执行投掷
-        roll = await self._roll_single(100)
+        roll = await self._roll_single(100, trace)
         
         # 4. 统一判定
         result_data = self._get_check_result(roll, target)
+        self._audit(event, "ra", f"{skill_name} {target}", trace, result_data["key"])
+        await self._update_stats(event.get_sender_id(), [roll], [result_data["key"]], chara=card)
         
         # 5. 获取风味文本
         flavor = ""
@@ -733,9 +1884,114 @@ class DicePlugin(Star):
 
         yield event.plain_result(f"🎲 {user_name} 进行了 {skill_name} 检定: 1d100={roll}/{target} {result_data['emoji']} {result_data['desc']}{flavor}")
 
+    async def _party_check(self, event: AstrMessageEvent, skill_name: Optional[str]):
+        """全队技能检定: 并发读卡，一次取齐所有 d100，合并为一条回复"""
+        group_id = event.message_obj.group_id
+        if not group_id:
+            yield event.plain_result("⚠️ 全队检定只能在群聊中使用。")
+            return
+        if not skill_name:
+            yield event.plain_result("⚠️ 请指定技能，例如 /ra all 侦查")
+            return
+        skill_name = str(skill_name)
+
+        members = await self._load_party_cards(group_id)
+        if not members:
+            yield event.plain_result("📭 本群还没有登记队伍，请队员使用 /party join 加入。")
+            return
+
+        ready, skipped = [], []
+        for uid, nick, card in members:
+            target = card.get("attributes", {}).get(skill_name) if card else None
+            if target is None:
+                skipped.append(nick)
+            else:
+                ready.append((uid, nick, card, target))
+
+        trace = []
+        rolls = await self._roll_batch(len(ready), 100, trace)
+
+        lines = [f"🎲 全队 {skill_name} 检定:"]
+        results = []
+        for (uid, nick, card, target), roll in zip(ready, rolls):
+            result_data = self._get_check_result(roll, target)
+            lines.append(f"- {nick}({card['name']}): 1d100={roll}/{target} {result_data['emoji']} {result_data['desc']}")
+            results.append([uid, roll, result_data["key"]])
+            await self._update_stats(uid, [roll], [result_data["key"]], chara=card)
+        if skipped:
+            lines.append(f"(未选卡或无此技能: {'、'.join(skipped)})")
+
+        if results:
+            self._audit(event, "ra_all", skill_name, trace, results)
+        yield await self._lines_result(event, lines)
+
+    async def _party_san_check(self, event: AstrMessageEvent, expr: Optional[str]):
+        """全队 San Check: 并发读卡，一次取齐所有 d100，扣除后批量写回"""
+        group_id = event.message_obj.group_id
+        if not group_id:
+            yield event.plain_result("⚠️ 全队 San Check 只能在群聊中使用。")
+            return
+        if not expr or "/" not in expr:
+            yield event.plain_result("⚠️ 格式错误，应为：/sanc all 成功扣除/失败扣除 (例: /sanc all 1/1d6)")
+            return
+        success_expr, fail_expr = expr.split("/", 1)
+
+        members = await self._load_party_cards(group_id)
+        if not members:
+            yield event.plain_result("📭 本群还没有登记队伍，请队员使用 /party join 加入。")
+            return
+
+        ready, skipped = [], []
+        for uid, nick, card in members:
+            if card and card.get("attributes", {}).get("san") is not None:
+                ready.append((uid, nick, card))
+            else:
+                skipped.append(nick)
+
+        # 扣除表达式按全队人数整体校验，超出预算时不消耗任何随机数
+        loss_terms = []
+        for loss_expr in (success_expr, fail_expr):
+            terms, err = self._check_dice_budget(loss_expr, repeat=max(len(ready), 1))
+            if terms is None:
+                yield event.plain_result(f"⚠️ 扣除表达式错误 ({loss_expr}): {err}")
+                return
+            loss_terms.append(terms)
+        success_terms, fail_terms = loss_terms
+
+        trace = []
+        rolls = await self._roll_batch(len(ready), 100, trace)
+
+        lines = ["🧠 **全队 San Check**"]
+        results, changed = [], []
+        for (uid, nick, card), roll in zip(ready, rolls):
+            san = card["attributes"]["san"]
+            is_success = roll <= san
+            loss, loss_desc = await self._eval_dice_terms(success_terms if is_success else fail_terms, trace)
+            new_san = max(0, san - loss)
+            if new_san != san:
+                card["attributes"]["san"] = new_san
+                changed.append((uid, card))
+
+            res_str = "✅" if is_success else "❌"
+            lines.append(f"- {nick}({card['name']}): {roll}/{san} {res_str} 扣除 {loss_desc}，San {san} → **{new_san}**")
+            results.append([uid, roll, san, new_san])
+            await self._update_stats(uid, [roll], [self._get_check_result(roll, san)["key"]], san - new_san, chara=card)
+        if skipped:
+            lines.append(f"(未选卡或无 san 属性: {'、'.join(skipped)})")
+
+        await self._save_character_batch(changed)
+        if results:
+            self._audit(event, "sanc_all", expr, trace, results)
+        yield await self._lines_result(event, lines)
+
     @filter.command("sanc", alias={"san"}) 
-    async def san_check(self, event: AstrMessageEvent, expr: str):
-        """SC: /sanc 1/1d3"""
+    async def san_check(self, event: AstrMessageEvent, expr: str, party_expr: str = None):
+        """SC: /sanc 1/1d3，/sanc all 1/1d6 全队 SC"""
+        if expr == "all":
+            async for result in self._party_san_check(event, party_expr):
+                yield result
+            return
+
         user_id = event.get_sender_id()
         data = await self._get_current_character(user_id)
         if not data:
@@ -752,15 +2008,26 @@ class DicePlugin(Star):
             return
             
         success_expr, fail_expr = expr.split("/", 1)
+
+        # 掷骰前先校验两个扣除表达式，任一不合法都不消耗随机数
+        success_terms, err = self._check_dice_budget(success_expr)
+        if success_terms is None:
+            yield event.plain_result(f"⚠️ 成功扣除表达式错误: {err}")
+            return
+        fail_terms, err = self._check_dice_budget(fail_expr)
+        if fail_terms is None:
+            yield event.plain_result(f"⚠️ 失败扣除表达式错误: {err}")
+            return
         
-        roll = random.randint(1, 100)
+        trace = []
+        roll = await self._roll_single(100, trace)
         is_success = roll <= san
         
-        loss_expr = success_expr if is_success else fail_expr
-        loss, loss_desc = await self._safe_parse_dice(loss_expr)
-        if loss is None: loss = 0 
+        loss, loss_desc = await self._eval_dice_terms(success_terms if is_success else fail_terms, trace)
         
         new_san = max(0, san - loss)
+        self._audit(event, "sanc", expr, trace, [san, new_san])
+        await self._update_stats(event.get_sender_id(), [roll], [self._get_check_result(roll, san)["key"]], san - new_san, chara=data)
         data["attributes"]["san"] = new_san
         await self._save_character_data(user_id, data["id"], data)
         
@@ -776,32 +2043,145 @@ class DicePlugin(Star):
     @filter.command("ti", alias={"临时疯狂"})
     async def temp_insanity(self, event: AstrMessageEvent, ignore_arg: str = ""):
         """抽取临时疯狂"""
+        await self._ensure_resources()
         roll = random.randint(1, 10)
-        insanities = [
-            "失忆：只记得最后身处的安全地点。",
-            "假性残疾：心理性失明、失聪或肢体缺失。",
-            "暴力倾向：对周围所有人展开攻击。",
-            "偏执：认为所有人都在图谋不轨。",
-            "人际依赖：将某人视为唯一的依靠。",
-            "昏厥：当场昏倒。",
-            "逃避行为：不顾一切地试图逃离。",
-            "歇斯底里：大笑、哭泣或尖叫。",
-            "恐惧：产生一种特定的恐惧症。",
-            "躁狂：产生一种特定的躁狂症。"
-        ]
-        
-        result = insanities[roll-1]
+        result = TEMP_INSANITIES[roll-1]
         extra_msg = ""
         
         if "恐惧" in result and self.phobias:
-            idx = str(random.randint(1, 100))
-            extra_msg = f"\n症状: {self.phobias.get(idx, '未知恐惧')}"
+            extra_msg = f"\n症状: {self.phobias[random.randint(1, len(self.phobias)) - 1] or '未知恐惧'}"
         elif "躁狂" in result and self.manias:
-            idx = str(random.randint(1, 100))
-            extra_msg = f"\n症状: {self.manias.get(idx, '未知躁狂')}"
+            extra_msg = f"\n症状: {self.manias[random.randint(1, len(self.manias)) - 1] or '未知躁狂'}"
             
         yield event.plain_result(f"🤪 **临时疯狂 (1d10={roll})**\n{result}{extra_msg}")
 
+    @filter.command_group("party")
+    def party_group(self):
+        pass
+
+    @party_group.command("join")
+    async def party_join(self, event: AstrMessageEvent, ignore_arg: str = ""):
+        """加入本群队伍，供 /ra all 与 /sanc all 使用"""
+        group_id = event.message_obj.group_id
+        if not group_id:
+            yield event.plain_result("⚠️ 队伍只能在群聊中登记。")
+            return
+        await self._ensure_resources()
+        self.parties.setdefault(str(group_id), {})[event.get_sender_id()] = event.get_sender_name()
+        await self._save_parties()
+        yield event.plain_result(f"🤝 {event.get_sender_name()} 已加入本群队伍。")
+
+    @party_group.command("leave")
+    async def party_leave(self, event: AstrMessageEvent, ignore_arg: str = ""):
+        await self._ensure_resources()
+        group_id = event.message_obj.group_id
+        party = self.parties.get(str(group_id), {})
+        if event.get_sender_id() not in party:
+            yield event.plain_result("⚠️ 你不在本群队伍中。")
+            return
+        del party[event.get_sender_id()]
+        await self._save_parties()
+        yield event.plain_result(f"👋 {event.get_sender_name()} 已离开本群队伍。")
+
+    @party_group.command("list")
+    async def party_list(self, event: AstrMessageEvent, ignore_arg: str = ""):
+        members = await self._load_party_cards(event.message_obj.group_id or "")
+        if not members:
+            yield event.plain_result("📭 本群还没有登记队伍。")
+            return
+        msg = ["👥 **本群队伍**："]
+        for _, nick, card in members:
+            msg.append(f"- {nick}: {card['name'] if card else '(未选卡)'}")
+        yield event.plain_result("\n".join(msg))
+
+    @filter.permission_type(filter.PermissionType.ADMIN)
+    @party_group.command("clear")
+    async def party_clear(self, event: AstrMessageEvent, ignore_arg: str = ""):
+        """清空本群队伍 (仅管理员)"""
+        await self._ensure_resources()
+        group_id = event.message_obj.group_id
+        if self.parties.pop(str(group_id), None) is not None:
+            await self._save_parties()
+        yield event.plain_result("🧹 已清空本群队伍。")
+
+    @filter.command("stats", alias={"运势"})
+    async def luck_stats_query(self, event: AstrMessageEvent, ignore_arg: str = ""):
+        """查看自己的掷骰统计 (总计与各人物卡)"""
+        if not self.luck_stats:
+            yield event.plain_result("ℹ️ 运势统计未启用。")
+            return
+
+        await self._ensure_resources()
+        user_id = event.get_sender_id()
+        user = self.luck_stats.get_user(user_id)
+        if not user:
+            yield event.plain_result("📭 你还没有任何掷骰记录。")
+            return
+
+        def fmt(title: str, agg: dict) -> str:
+            s = LuckStats.summarize(agg)
+            text = (
+                f"{title}\n"
+                f"  检定 {s['checks']} 次 | d100 {s['d100_count']} 次 均值 {s['d100_mean']:.1f} (σ {s['d100_std']:.1f})\n"
+                f"  成功率 {s['success_rate']:.0%} | 大成功 {s['critical_rate']:.1%} | 大失败 {s['fumble_rate']:.1%}"
+            )
+            if s["san_checks"]:
+                text += f"\n  San Check {s['san_checks']} 次，共损失 {s['san_lost']} 点"
+            return text
+
+        lines = [f"📊 **{event.get_sender_name()} 的运势统计**", fmt("【总计】", user["total"])]
+        for cid, agg in user.get("characters", {}).items():
+            lines.append(fmt(f"【{agg.get('name') or '...' + cid[-4:]}】", agg))
+        yield event.plain_result("\n".join(lines))
+
+    @filter.command("log", alias={"掷骰记录"})
+    async def roll_log(self, event: AstrMessageEvent, limit: int = 10):
+        """查看本群最近的掷骰审计记录 /log [条数]"""
+        if not self.audit_log:
+            yield event.plain_result("ℹ️ 掷骰审计日志未启用。")
+            return
+
+        limit = max(1, min(int(limit), 50))
+        group_id = event.message_obj.group_id
+        group_key = str(group_id) if group_id else f"private_{event.get_sender_id()}"
+        entries = await self.audit_log.tail(group_key, limit)
+        if not entries:
+            yield event.plain_result("📭 暂无掷骰记录。")
+            return
+
+        # 暗骰结果只对掷骰者本人和管理员可见
+        caller_id = str(event.get_sender_id())
+        is_admin = event.is_admin()
+
+        lines = [f"📒 **最近 {len(entries)} 条掷骰记录**"]
+        for e in entries:
+            ts = time.strftime("%m-%d %H:%M:%S", time.localtime(e.get("t", 0)))
+            sources = "/".join(e.get("s", [])) or "-"
+            if e.get("h") and e.get("u") != caller_id and not is_admin:
+                lines.append(f"[{ts}] {e.get('n', e.get('u'))} /{e.get('k')} (暗骰，结果已隐藏) [{sources}]")
+                continue
+            dice = " ".join(f"d{faces}={value}" for faces, value in e.get("d", []))
+            hidden = " (暗骰)" if e.get("h") else ""
+            lines.append(f"[{ts}] {e.get('n', e.get('u'))} /{e.get('k')} {e.get('e')}{hidden}: {dice} → {e.get('r')} [{sources}]")
+        yield event.plain_result("\n".join(lines))
+
+    @filter.command("rngstat", alias={"熵源状态"})
+    async def rng_status(self, event: AstrMessageEvent, ignore_arg: str = ""):
+        """查看各熵源的熔断状态与延迟"""
+        if not self.rng_manager:
+            yield event.plain_result("ℹ️ 真随机未启用，当前使用本地伪随机。")
+            return
+
+        state_names = {"closed": "🟢 正常", "half_open": "🟡 试探中", "open": "🔴 熔断"}
+        lines = [f"⚛ **熵源状态** (缓存 {len(self.rng_manager.buffer)}/{self.rng_manager.buffer_size})"]
+        for m in self.rng_manager.get_metrics():
+            latency = f"{m['avg_latency_ms']}ms" if m["avg_latency_ms"] is not None else "-"
+            line = f"- {m['name']}: {state_names.get(m['state'], m['state'])} 成功{m['successes']} 失败{m['failures']} 延迟{latency}"
+            if m["last_error"] and m["state"] != "closed":
+                line += f"\n  最近错误: {m['last_error']}"
+            lines.append(line)
+        yield event.plain_result("\n".join(lines))
+
     # ================= 帮助指令 =================
     @filter.command("dicehelp", alias={"subrosa_dice"})
     async def dice_help(self, event: AstrMessageEvent, ignore_arg: str = ""):
@@ -816,6 +2196,8 @@ class DicePlugin(Star):
                         {"syntax": "/r [次数]#[表达式]", "desc": "重复投掷多次表达式", "example": "/r 3#4d6k3 (投3次，每次4d6取前3)"},
                         {"syntax": "/r [表达式] [判定值]", "desc": "投掷并与目标值对比判定", "example": "/r 1d100 60"},
                         {"syntax": "/rh [表达式]", "desc": "暗骰模式，结果私聊发送给指令者", "example": "/rh 1d100 (仅你自己可见)"},
+                        {"syntax": "/rngstat", "desc": "查看真随机熵源的健康状态与延迟", "example": "/rngstat"},
+                        {"syntax": "/log [条数]", "desc": "查看本群最近的掷骰审计记录 (需开启审计日志)", "example": "/log 20"},
                     ]
                 },
                 {
@@ -824,6 +2206,8 @@ class DicePlugin(Star):
                         {"syntax": "/st create [名] [属性]", "desc": "创建一张新的人物卡", "example": "/st create 洛萨 力量60 敏捷70 智力80"},
                         {"syntax": "/st show", "desc": "查看当前选中的人物卡详情", "example": "/st show"},
                         {"syntax": "/st list", "desc": "查看所有已保存的人物卡", "example": "/st list"},
+                        {"syntax": "/st import [多行文本]", "desc": "批量导入人物卡 (Dice! / CSV / JSON Lines)", "example": "/st import ⏎ 洛萨-力量60敏捷70 ⏎ 艾琳-力量40敏捷80"},
+                        {"syntax": "/st export", "desc": "导出全部人物卡为压缩包", "example": "/st export"},
                         {"syntax": "/st change [名]", "desc": "切换当前激活的人物卡", "example": "/st change 洛萨"},
                         {"syntax": "/st update [属性] [值]", "desc": "修改当前卡属性 (支持加减公式)", "example": "/st update hp -1d3 (扣除1d3点血量)"},
                     ]
@@ -835,7 +2219,11 @@ class DicePlugin(Star):
                         {"syntax": "/ra [属性名]", "desc": "自动读取当前卡属性进行检定", "example": "/ra 侦查 (自动读取侦查数值)"},
                         {"syntax": "/ra [属性] [数值]", "desc": "指定属性和数值进行检定", "example": "/ra 射击 80"},
                         {"syntax": "/sanc [成功]/[失败]", "desc": "San Check，自动计算并扣除理智", "example": "/sanc 1/1d6 (成功扣1，失败扣1d6)"},
+                        {"syntax": "/party join|leave|list|clear", "desc": "登记/查看本群队伍成员 (clear 仅管理员)", "example": "/party join"},
+                        {"syntax": "/ra all [属性名]", "desc": "全队使用各自当前卡进行检定", "example": "/ra all 侦查"},
+                        {"syntax": "/sanc all [成功]/[失败]", "desc": "全队 San Check，合并回复", "example": "/sanc all 0/1d6"},
                         {"syntax": "/ti", "desc": "抽取临时疯狂症状 (含恐惧/躁狂)", "example": "/ti"},
+                        {"syntax": "/stats", "desc": "查看个人及各人物卡的检定统计与 San 损失", "example": "/stats"},
                     ]
                 }
             ]